@@ -1,7 +1,8 @@
+import asyncio
 import json
-import re
 import os
 import sys
+import time
 from telegram import Update
 from telegram.ext import (
     ApplicationBuilder,
@@ -11,47 +12,88 @@ from telegram.ext import (
     filters,
 )
 from keep_alive import keep_alive
+from link_filters import contains_link
+from warnings_journal import WarningsJournal
 
 
-# Levanta el mini servidor SOLO en Replit
-if os.environ.get("REPL_ID"):
-    keep_alive()
-
 # ------------------ CONFIG ------------------
 BOT_TOKEN = os.environ["BOT_TOKEN"]  # asegúrate de crearla en Secrets
 
-KNOWN_USERS_FILE = "/data/known_users.json"
-WARNINGS_FILE = "/data/warnings.json"
+# Si corremos como worker de shards.py, cada shard tiene su propia carpeta de datos
+BOT_SHARD = os.environ.get("BOT_SHARD")
+DATA_DIR = f"/data/shard-{BOT_SHARD}" if BOT_SHARD is not None else "/data"
+
+KNOWN_USERS_FILE = f"{DATA_DIR}/known_users.json"
+WARNINGS_FILE = f"{DATA_DIR}/warnings.json"  # snapshot
+WARNINGS_JOURNAL_FILE = f"{DATA_DIR}/warnings.log"  # eventos desde el último snapshot
+COMPACT_EVERY_SECONDS = 300  # 5 minutos
+ADMIN_CACHE_SECONDS = 300  # cuánto tiempo confiamos en la lista de admins de un chat
 MAX_WARNINGS = 3
 DELETE_AFTER_SECONDS = 120  # 2 minutos
 # -------------------------------------------
 
+# Levanta el mini servidor SOLO en Replit (en modo shards lo levanta el proceso frontal)
+if os.environ.get("REPL_ID") and BOT_SHARD is None:
+    keep_alive()
+
 # Inicializar bot
 app = ApplicationBuilder().token(BOT_TOKEN).build()
 
 # ---------- HELPER: ADMIN NORMAL O ANÓNIMO ----------
-async def es_admin_o_anon(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
+# chat_id -> (expira_en, {ids de admins}); vive en memoria de este proceso
+admin_cache = {}
+
+
+async def get_admin_ids(
+    context: ContextTypes.DEFAULT_TYPE, chat_id: int, use_cache: bool = False
+) -> set:
+    """
+    Devuelve los ids de admins del chat.
+    use_cache=True solo para el camino rápido de check_links, y ahí solo cuenta un
+    "no es admin" del cache (ver es_admin_o_anon). Los comandos de admin siempre
+    preguntan a Telegram (y de paso refrescan el cache).
+    """
+    now = time.monotonic()
+    cached = admin_cache.get(chat_id)
+    if use_cache and cached and cached[0] > now:
+        return cached[1]
+
+    try:
+        admins = await context.bot.get_chat_administrators(chat_id)
+    except Exception as e:
+        print(f"Error obteniendo administradores: {e}", file=sys.stderr)
+        # Sin cachear: la próxima vez se vuelve a intentar
+        return set()
+
+    admin_ids = {a.user.id for a in admins if a and a.user}
+    admin_cache[chat_id] = (now + ADMIN_CACHE_SECONDS, admin_ids)
+    return admin_ids
+
+
+async def es_admin_o_anon(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, use_cache: bool = False
+) -> bool:
     """
     Devuelve True si el que manda el mensaje es:
     - admin/creator "normal"
     - o admin anónimo (mensaje enviado en nombre del grupo)
+    use_cache: ver get_admin_ids (solo para check_links).
     """
     chat = update.effective_chat
     msg = update.effective_message
     user = update.effective_user
 
     # Lista de admins reales del chat
-    try:
-        admins = await context.bot.get_chat_administrators(chat.id)
-    except Exception as e:
-        print(f"Error obteniendo administradores: {e}", file=sys.stderr)
-        admins = []
-
-    admin_ids = {a.user.id for a in admins if a and a.user}
+    admin_ids = await get_admin_ids(context, chat.id, use_cache)
 
     # Caso 1: usuario visible y admin normal
     if user and user.id in admin_ids:
-        return True
+        if not use_cache:
+            return True
+        # Del cache solo nos fiamos para el "no es admin": si dice que sí, confirmar
+        # en vivo, por si lo degradaron hace poco y quiere colar links
+        if user.id in await get_admin_ids(context, chat.id):
+            return True
 
     # Caso 2: mensaje enviado "como el grupo" (admin anónimo)
     if msg and msg.sender_chat and msg.sender_chat.id == chat.id:
@@ -60,19 +102,18 @@ async def es_admin_o_anon(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     return False
 
 
+async def prune_admin_cache(context: ContextTypes.DEFAULT_TYPE):
+    """Callback del JobQueue: saca del cache los chats cuya entrada ya expiró."""
+    now = time.monotonic()
+    for chat_id in [c for c, (expires, _) in admin_cache.items() if expires <= now]:
+        del admin_cache[chat_id]
+
+
 # ------------------ CARGA DE WARNINGS ------------------
-try:
-    with open(WARNINGS_FILE, "r") as f:
-        content = f.read().strip()
-        warnings = json.loads(content) if content else {}
-except FileNotFoundError:
-    warnings = {}
-    try:
-        os.makedirs(os.path.dirname(WARNINGS_FILE), exist_ok=True)
-        with open(WARNINGS_FILE, "w") as f:
-            json.dump(warnings, f)
-    except Exception as e:
-        print(f"Error creando {WARNINGS_FILE}: {e}", file=sys.stderr)
+# Snapshot + bitácora: al arrancar se reaplica la cola y se deja todo en un snapshot limpio
+warnings_journal = WarningsJournal(WARNINGS_FILE, WARNINGS_JOURNAL_FILE)
+warnings = warnings_journal.load()
+warnings_journal.compact(warnings)
 
 
 # ------------------ CARGA DE KNOWN_USERS ------------------
@@ -103,22 +144,28 @@ def save_known_users():
         print(f"Error guardando known_users: {e}", file=sys.stderr)
 
 
-def save_warnings():
-    """Guarda el diccionario de advertencias en el archivo (persistente en /data)."""
-    try:
-        # Asegurar que el directorio exista
-        os.makedirs(os.path.dirname(WARNINGS_FILE), exist_ok=True)
+def save_warning_event(op: str, key: str):
+    """
+    Registra un cambio de warnings en la bitácora (/data/warnings.log).
+    op: "warn", "unwarn" o "ban". Para "warn" se guarda el conteo actual de la llave.
+    """
+    count = warnings.get(key) if op == "warn" else None
+    warnings_journal.append(op, key, count)
+    print(f"WARNING EVENT: {op} {key} {count if count is not None else ''}".rstrip())
 
-        with open(WARNINGS_FILE, "w") as f:
-            json.dump(warnings, f)
-            f.flush()
-            os.fsync(f.fileno())
 
-        print("WARNINGS GUARDADOS:", warnings)
-        print("Archivo guardado en:", os.path.abspath(WARNINGS_FILE))
+async def compact_warnings(context: ContextTypes.DEFAULT_TYPE):
+    """
+    Callback del JobQueue: vuelca warnings a un snapshot y recorta la bitácora.
+    El json.dump + fsync (lo que cuesta según el tamaño de la tabla) va en un hilo
+    para no frenar al bot; el corte y el recorte son baratos y van en el loop.
+    """
+    if not warnings_journal.pending_events:
+        return
 
-    except Exception as e:
-        print(f"Error guardando warnings: {e}", file=sys.stderr)
+    data, offset = warnings_journal.cut(warnings)
+    if await asyncio.to_thread(warnings_journal.write_snapshot, data):
+        warnings_journal.trim(offset)
 
 
 def register_user(chat_id: str, user):
@@ -179,30 +226,6 @@ def find_users_in_chat_by_query(chat_id: str, query: str):
     return matches
 
 
-# Regex para enlaces prohibidos
-WHATSAPP_REGEX = re.compile(r"https?://chat\.whatsapp\.com/[^\s]+", re.IGNORECASE)
-TELEGRAM_REGEX = re.compile(r"(https?://)?t\.me/\+?[^\s]+", re.IGNORECASE)
-URL_SHORTENERS = re.compile(
-    r"https?://(bit\.ly|tinyurl\.com|goo\.gl|t\.co|rebrand\.ly)/[^\s]+",
-    re.IGNORECASE,
-)
-
-
-def contains_link(message: str) -> bool:
-    """Devuelve True si el mensaje contiene un enlace que queremos bloquear."""
-    if not message:
-        return False
-
-    if (
-        WHATSAPP_REGEX.search(message)
-        or TELEGRAM_REGEX.search(message)
-        or URL_SHORTENERS.search(message)
-    ):
-        return True
-
-    return False
-
-
 # --- JOB PARA BORRAR MENSAJES DEL BOT DESPUÉS DE X TIEMPO ---
 async def delete_message_later(context: ContextTypes.DEFAULT_TYPE):
     """Callback del JobQueue: borra un mensaje pasado un tiempo."""
@@ -479,7 +502,7 @@ async def unwarn(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     if key in warnings:
         del warnings[key]
-        save_warnings()
+        save_warning_event("unwarn", key)
         result_text = f"🧹 Limpio el historial de {display_name}. Como si nada hubiera pasado 😉"
     else:
         result_text = f"{display_name} no tiene advertencias registradas."
@@ -551,10 +574,12 @@ async def debug_warnings(update: Update, context: ContextTypes.DEFAULT_TYPE):
     from pprint import pformat
     warnings_text = pformat(warnings, width=80)
     file_path = os.path.abspath(WARNINGS_FILE)
+    journal_path = os.path.abspath(WARNINGS_JOURNAL_FILE)
 
     texto = (
         "🐛 DEBUG DE ADVERTENCIAS\n\n"
-        f"Archivo donde se guardan las advertencias:\n`{file_path}`\n\n"
+        f"Snapshot donde se guardan las advertencias:\n`{file_path}`\n"
+        f"Bitácora ({warnings_journal.pending_events} eventos sin compactar):\n`{journal_path}`\n\n"
         f"Esto es lo que tiene guardado el bot en este momento:\n```{warnings_text}```"
     )
 
@@ -580,7 +605,7 @@ async def check_links(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = str(update.effective_chat.id)
 
     # Si es admin normal o anónimo, ignorar (no dar warnings)
-    es_admin = await es_admin_o_anon(update, context)
+    es_admin = await es_admin_o_anon(update, context, use_cache=True)
     if es_admin:
         return
 
@@ -617,7 +642,7 @@ async def check_links(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         # 2) Sumar advertencia
         warnings[key] = warnings.get(key, 0) + 1
-        save_warnings()
+        save_warning_event("warn", key)
 
         current_warnings = warnings[key]
 
@@ -653,7 +678,7 @@ async def check_links(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 await context.bot.ban_chat_member(chat_id, user_id)
                 # Limpiar advertencias de ese usuario en ese grupo
                 del warnings[key]
-                save_warnings()
+                save_warning_event("ban", key)
 
                 kick_text = (
                     f"{update.effective_user.first_name} llegó al límite.\n\n"
@@ -681,6 +706,19 @@ app.add_handler(CommandHandler("unwarn", unwarn))
 app.add_handler(CommandHandler("debugwarnings", debug_warnings))
 app.add_handler(MessageHandler(filters.TEXT & (~filters.COMMAND), check_links))
 
+# ------------------ JOBS ------------------
+if app.job_queue:
+    app.job_queue.run_repeating(
+        compact_warnings,
+        interval=COMPACT_EVERY_SECONDS,
+        first=COMPACT_EVERY_SECONDS,
+    )
+    app.job_queue.run_repeating(
+        prune_admin_cache,
+        interval=ADMIN_CACHE_SECONDS,
+        first=ADMIN_CACHE_SECONDS,
+    )
+
 # ---------------- RUN BOT -----------------
 if __name__ == "__main__":
     print("Bot corriendo...")
@@ -0,0 +1,344 @@
+"""
+Pasa un export de historial de Telegram por las mismas reglas que usa el bot
+(link_filters) sin tener que probarlas en vivo en un grupo.
+
+Uso:
+    python classify_export.py result.json
+    python classify_export.py mensajes.jsonl --workers 8 --json
+
+Acepta el result.json de Telegram Desktop ({"messages": [...]}) o JSONL con un
+mensaje por línea. El archivo se lee por pedazos, así que no tiene que caber en memoria.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from link_filters import LINK_RULES, matching_rules
+
+
+READ_SIZE = 1 << 20  # 1 MB por lectura
+MESSAGES_START = re.compile(r'"messages"\s*:\s*\[')
+SNIPPET_CHARS = 120
+# Si el mensaje trae alguna de estas llaves, su "text" es un caption: el bot no lo revisa
+MEDIA_KEYS = ("photo", "file", "media_type")
+
+
+# ------------------ LECTURA INCREMENTAL ------------------
+def iter_export_messages(f):
+    """Recorre la lista "messages" de un result.json sin cargar el archivo completo."""
+    decoder = json.JSONDecoder()
+    buf = ""
+
+    # 1) Buscar dónde empieza la lista de mensajes
+    while True:
+        m = MESSAGES_START.search(buf)
+        if m:
+            buf = buf[m.end():]
+            break
+        chunk = f.read(READ_SIZE)
+        if not chunk:
+            raise ValueError('No encontré la lista "messages" en el export.')
+        # Guardar la cola por si la llave quedó partida entre dos lecturas
+        buf = buf[-64:] + chunk
+
+    # 2) Decodificar los mensajes uno por uno, pidiendo más texto cuando falte
+    pos = 0
+    eof = False
+    while True:
+        while pos < len(buf) and buf[pos] in " \t\r\n,":
+            pos += 1
+
+        if pos < len(buf):
+            if buf[pos] == "]":
+                return
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                # Mensaje incompleto: lo normal es que siga en la próxima lectura
+                if eof:
+                    raise
+            else:
+                pos = end
+                yield obj
+                continue
+
+        if eof:
+            raise ValueError("El export terminó antes de cerrar la lista de mensajes.")
+
+        chunk = f.read(READ_SIZE)
+        eof = not chunk
+        buf = buf[pos:] + chunk
+        pos = 0
+
+
+def iter_jsonl_messages(f):
+    """Un mensaje JSON por línea. Las líneas vacías o ilegibles se saltan."""
+    for line_number, line in enumerate(f, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            print(f"Línea {line_number} ilegible, se ignora.", file=sys.stderr)
+
+
+def message_text(msg: dict) -> str:
+    """
+    Texto plano del mensaje, como lo vería el bot en update.message.text.
+    En el export de Telegram "text" puede ser str o lista de str / {"type", "text"}.
+    """
+    text = msg.get("text")
+    if isinstance(text, str):
+        return text
+    if isinstance(text, list):
+        parts = []
+        for part in text:
+            if isinstance(part, str):
+                parts.append(part)
+            elif isinstance(part, dict):
+                parts.append(part.get("text") or "")
+        return "".join(parts)
+    return ""
+
+
+def is_command(msg: dict, text: str) -> bool:
+    """
+    Igual que filters.COMMAND: el mensaje empieza con una entidad bot_command.
+    Usa las entidades del export (text_entities, o "text" en forma de lista) o las
+    de la Bot API (entities con offset); solo si no hay ninguna, mira si empieza con "/".
+    """
+    entities = msg.get("entities")
+    if isinstance(entities, list):
+        return any(
+            isinstance(e, dict) and e.get("type") == "bot_command" and e.get("offset") == 0
+            for e in entities
+        )
+
+    # En el export las entidades no traen offset: van en orden y juntas forman el texto
+    entities = msg.get("text_entities")
+    if entities is None and isinstance(msg.get("text"), list):
+        entities = msg["text"]
+    if isinstance(entities, list):
+        for e in entities:
+            if isinstance(e, str):
+                if e:
+                    return False
+                continue
+            if isinstance(e, dict) and e.get("text"):
+                return e.get("type") == "bot_command"
+        return False
+
+    return text.startswith("/")
+
+
+def iter_chunks(messages, chunk_size: int, skipped: dict):
+    """
+    Agrupa los mensajes con texto en listas de (id, texto) para mandarlas al pool.
+    Solo pasan los que el bot revisaría en vivo (filters.TEXT & ~filters.COMMAND):
+    los captions de media y los comandos se cuentan en `skipped` y no se clasifican.
+    """
+    chunk = []
+    for msg in messages:
+        if not isinstance(msg, dict):
+            continue
+        # Mensajes de servicio (alguien entró, fijó un mensaje, etc.)
+        if msg.get("type", "message") != "message":
+            continue
+
+        text = message_text(msg)
+        if not text:
+            continue
+
+        if any(k in msg for k in MEDIA_KEYS):
+            skipped["media"] += 1
+            continue
+        if is_command(msg, text):
+            skipped["commands"] += 1
+            continue
+
+        chunk.append((msg.get("id", msg.get("message_id")), text))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+
+# ------------------ CLASIFICACIÓN ------------------
+def looks_like_false_positive(text: str, match) -> bool:
+    """
+    Heurística: el match está pegado a otra palabra o dominio
+    (ej. "robot.me/foo" pega en la regla de t.me). Vale la pena revisarlo a mano.
+    """
+    start = match.start()
+    if start == 0:
+        return False
+    prev = text[start - 1]
+    return prev.isalnum() or prev in "._-/@"
+
+
+def classify_chunk(chunk, max_candidates: int) -> dict:
+    """Corre en los procesos del pool. Devuelve conteos parciales del pedazo."""
+    result = {
+        "messages": 0,
+        "flagged": 0,
+        "rules": {name: 0 for name in LINK_RULES},
+        "false_positive_candidates": 0,
+        "candidates": [],
+    }
+
+    for message_id, text in chunk:
+        result["messages"] += 1
+        hits = matching_rules(text)
+        if not hits:
+            continue
+
+        result["flagged"] += 1
+        for name, match in hits:
+            result["rules"][name] += 1
+
+            if looks_like_false_positive(text, match):
+                result["false_positive_candidates"] += 1
+                if len(result["candidates"]) < max_candidates:
+                    result["candidates"].append({
+                        "id": message_id,
+                        "rule": name,
+                        "match": match.group(0),
+                        "text": text[:SNIPPET_CHARS],
+                    })
+
+    return result
+
+
+def merge_result(totals: dict, partial: dict, max_candidates: int):
+    totals["messages"] += partial["messages"]
+    totals["flagged"] += partial["flagged"]
+    totals["false_positive_candidates"] += partial["false_positive_candidates"]
+    for name, count in partial["rules"].items():
+        totals["rules"][name] += count
+
+    room = max_candidates - len(totals["candidates"])
+    if room > 0:
+        totals["candidates"].extend(partial["candidates"][:room])
+
+
+# ------------------ REPORTE ------------------
+def print_report(totals: dict):
+    messages = totals["messages"]
+    flagged = totals["flagged"]
+    pct = (flagged / messages * 100) if messages else 0.0
+
+    print(f"Mensajes revisados: {messages}")
+    print(f"Mensajes marcados:  {flagged} ({pct:.2f}%)")
+    print(
+        f"Sin revisar (el bot no los ve): {totals['skipped']['media']} captions de media, "
+        f"{totals['skipped']['commands']} comandos"
+    )
+    print()
+    print("Hits por regla:")
+    for name, count in totals["rules"].items():
+        print(f"  {name:<10} {count}")
+    print()
+    print(
+        f"Posibles falsos positivos: {totals['false_positive_candidates']} "
+        f"(mostrando {len(totals['candidates'])})"
+    )
+    for c in totals["candidates"]:
+        print(f"  [{c['id']}] {c['rule']}: «{c['match']}» — {c['text']!r}")
+    print()
+    print(
+        f"Velocidad: {totals['messages_per_second']:.0f} mensajes/s "
+        f"({totals['elapsed_seconds']:.2f} s, {totals['workers']} procesos)"
+    )
+
+
+# ------------------ CLI ------------------
+def positive_int(value: str) -> int:
+    """type= de argparse: entero mayor que cero."""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"no es un entero: {value!r}")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"tiene que ser mayor que cero: {number}")
+    return number
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Clasifica un export de Telegram con las reglas de enlaces del bot."
+    )
+    parser.add_argument("path", help="result.json (o su carpeta) o archivo .jsonl")
+    parser.add_argument(
+        "--format",
+        choices=("auto", "export", "jsonl"),
+        default="auto",
+        help="auto: .jsonl/.ndjson es JSONL, lo demás es result.json de Telegram",
+    )
+    parser.add_argument("--workers", type=positive_int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=positive_int, default=2000)
+    parser.add_argument("--max-candidates", type=int, default=20)
+    parser.add_argument("--json", action="store_true", help="imprime el reporte como JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    path = args.path
+    if os.path.isdir(path):
+        path = os.path.join(path, "result.json")
+
+    fmt = args.format
+    if fmt == "auto":
+        fmt = "jsonl" if path.endswith((".jsonl", ".ndjson")) else "export"
+
+    totals = {
+        "messages": 0,
+        "flagged": 0,
+        "rules": {name: 0 for name in LINK_RULES},
+        "false_positive_candidates": 0,
+        "candidates": [],
+        "skipped": {"media": 0, "commands": 0},
+    }
+
+    started = time.perf_counter()
+    try:
+        with open(path, "r", encoding="utf-8") as f, \
+                ProcessPoolExecutor(max_workers=args.workers) as pool:
+            messages = iter_jsonl_messages(f) if fmt == "jsonl" else iter_export_messages(f)
+
+            # Pocos pedazos en vuelo a la vez, para no leer el archivo entero de golpe
+            pending = set()
+            for chunk in iter_chunks(messages, args.chunk_size, totals["skipped"]):
+                pending.add(pool.submit(classify_chunk, chunk, args.max_candidates))
+                if len(pending) >= args.workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        merge_result(totals, fut.result(), args.max_candidates)
+
+            for fut in pending:
+                merge_result(totals, fut.result(), args.max_candidates)
+    except (OSError, ValueError) as e:
+        # Archivo que no existe, export sin "messages", JSON roto, etc.
+        print(f"Error leyendo {path}: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    elapsed = time.perf_counter() - started
+    totals["elapsed_seconds"] = elapsed
+    totals["messages_per_second"] = totals["messages"] / elapsed if elapsed else 0.0
+    totals["workers"] = args.workers
+
+    if args.json:
+        print(json.dumps(totals, ensure_ascii=False, indent=2))
+    else:
+        print_report(totals)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,34 @@
-from flask import Flask
+from flask import Flask, jsonify
 from threading import Thread
 
 app = Flask(__name__)
 
+# Función que devuelve un dict con métricas (la registra shards.py); None en modo normal
+metrics_provider = None
+
 @app.route("/")
 def home():
     return "Bot is alive"
 
+@app.route("/health")
+def health():
+    if metrics_provider is None:
+        return jsonify({"ok": True})
+    data = metrics_provider()
+    return jsonify({"ok": data["ok"]}), (200 if data["ok"] else 503)
+
+@app.route("/metrics")
+def metrics():
+    if metrics_provider is None:
+        return jsonify({})
+    return jsonify(metrics_provider())
+
 def run():
     app.run(host="0.0.0.0", port=8080)
 
-def keep_alive():
+def keep_alive(metrics=None):
+    global metrics_provider
+    metrics_provider = metrics
     t = Thread(target=run)
     t.daemon = True
     t.start()
@@ -0,0 +1,41 @@
+import re
+
+
+# Regex para enlaces prohibidos
+WHATSAPP_REGEX = re.compile(r"https?://chat\.whatsapp\.com/[^\s]+", re.IGNORECASE)
+TELEGRAM_REGEX = re.compile(r"(https?://)?t\.me/\+?[^\s]+", re.IGNORECASE)
+URL_SHORTENERS = re.compile(
+    r"https?://(bit\.ly|tinyurl\.com|goo\.gl|t\.co|rebrand\.ly)/[^\s]+",
+    re.IGNORECASE,
+)
+
+# Nombre de cada regla -> regex. Para agregar una regla, agrégala aquí y la usan el bot y el CLI
+LINK_RULES = {
+    "whatsapp": WHATSAPP_REGEX,
+    "telegram": TELEGRAM_REGEX,
+    "acortador": URL_SHORTENERS,
+}
+
+
+def contains_link(message: str) -> bool:
+    """Devuelve True si el mensaje contiene un enlace que queremos bloquear."""
+    if not message:
+        return False
+
+    return any(regex.search(message) for regex in LINK_RULES.values())
+
+
+def matching_rules(message: str) -> list:
+    """
+    Devuelve [(nombre_regla, match)] con TODAS las reglas que pegan en el mensaje.
+    Usa las mismas LINK_RULES que contains_link, así que siempre coinciden.
+    """
+    if not message:
+        return []
+
+    hits = []
+    for name, regex in LINK_RULES.items():
+        match = regex.search(message)
+        if match:
+            hits.append((name, match))
+    return hits
@@ -0,0 +1,364 @@
+"""
+Modo multi-proceso: un proceso frontal recibe los updates (polling o webhook)
+y los reparte por chat_id entre N workers. Cada worker importa bot.py con su
+propio BOT_SHARD, así que tiene su propio warnings/known_users, sus archivos en
+/data/shard-N y su cache de admins. Nada se comparte en el camino caliente.
+
+Uso:
+    BOT_WORKERS=4 python shards.py
+
+La primera vez que se arranca en este modo, los datos del modo normal
+(/data/warnings.json, warnings.log, known_users.json) se reparten entre los
+shards y los originales se mueven a /data/migrated-<ts>/.
+
+El número de shards queda guardado en /data/shards.json. Si arrancas con otro
+BOT_WORKERS, las carpetas shard-* se vuelven a repartir con el nuevo número
+(las viejas quedan en /data/resharded-<ts>/).
+"""
+import asyncio
+import glob
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import time
+from telegram import Update
+from telegram.ext import ApplicationBuilder, ContextTypes, TypeHandler
+from keep_alive import keep_alive
+from warnings_journal import WarningsJournal
+
+
+# ------------------ CONFIG ------------------
+BOT_TOKEN = os.environ["BOT_TOKEN"]
+BOT_WORKERS = int(os.environ.get("BOT_WORKERS", "2"))
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL")  # si no está, usamos polling
+WEBHOOK_PORT = int(os.environ.get("WEBHOOK_PORT", "8443"))
+
+DATA_DIR = "/data"  # misma carpeta que usa bot.py en modo normal
+LEGACY_FILES = ("warnings.json", "warnings.log", "known_users.json")
+SHARDS_FILE = f"{DATA_DIR}/shards.json"  # con cuántos shards están repartidos los datos
+CHECK_WORKERS_SECONDS = 10  # cada cuánto revisamos que los workers sigan vivos
+RESPAWN_MIN_SECONDS = 10  # no relanzar un worker más seguido que esto (por si truena al arrancar)
+# -------------------------------------------
+
+
+def shard_for(chat_id: int, workers: int) -> int:
+    """Shard al que pertenece un chat. Estable entre reinicios (no usa hash() de str)."""
+    return abs(chat_id) % workers
+
+
+def shard_data_dir(shard_id: int) -> str:
+    """Carpeta de datos de un shard (igual que DATA_DIR en bot.py con BOT_SHARD puesto)."""
+    return f"{DATA_DIR}/shard-{shard_id}"
+
+
+# ------------------ MIGRACIÓN DESDE MODO NORMAL ------------------
+def read_json_dict(path: str) -> dict:
+    try:
+        with open(path, "r") as f:
+            content = f.read().strip()
+            return json.loads(content) if content else {}
+    except FileNotFoundError:
+        return {}
+
+
+def write_json_atomic(path: str, data: dict):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_file = path + ".tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, path)
+
+
+def split_by_shard(data: dict, workers: int) -> list:
+    """Reparte un dict con llaves "chat_id:user_id" en una lista de dicts, uno por shard."""
+    parts = [{} for _ in range(workers)]
+    for key, value in data.items():
+        try:
+            chat_id = int(key.split(":", 1)[0])
+        except ValueError:
+            print(f"Llave inválida al migrar, se ignora: {key}", file=sys.stderr)
+            continue
+        parts[shard_for(chat_id, workers)][key] = value
+    return parts
+
+
+def migrate_legacy_data(workers: int):
+    """
+    Reparte los datos del modo de un solo proceso entre los shards, una sola vez.
+    Los datos del modo normal mandan sobre lo que ya tuviera el shard: si existen,
+    es porque fue lo último que corrió.
+    """
+    legacy = [name for name in LEGACY_FILES if os.path.exists(f"{DATA_DIR}/{name}")]
+    if not legacy:
+        return
+
+    legacy_warnings = WarningsJournal(
+        f"{DATA_DIR}/warnings.json", f"{DATA_DIR}/warnings.log"
+    ).load()
+    legacy_known_users = read_json_dict(f"{DATA_DIR}/known_users.json")
+
+    warnings_parts = split_by_shard(legacy_warnings, workers)
+    known_users_parts = split_by_shard(legacy_known_users, workers)
+
+    for shard_id in range(workers):
+        shard_dir = shard_data_dir(shard_id)
+
+        warnings, known_users = load_shard_dir(shard_dir)
+        warnings.update(warnings_parts[shard_id])
+        known_users.update(known_users_parts[shard_id])
+        write_shard_dir(shard_dir, warnings, known_users)
+
+    # Apartar los originales para no volver a migrarlos en el próximo arranque
+    backup_dir = f"{DATA_DIR}/migrated-{int(time.time())}"
+    os.makedirs(backup_dir, exist_ok=True)
+    for name in legacy:
+        if os.path.exists(f"{DATA_DIR}/{name}"):
+            os.replace(f"{DATA_DIR}/{name}", f"{backup_dir}/{name}")
+
+    print(
+        f"Migrados {len(legacy_warnings)} warnings y {len(legacy_known_users)} usuarios "
+        f"a {workers} shards. Originales en {backup_dir}"
+    )
+
+
+# ------------------ CAMBIO DE NÚMERO DE SHARDS ------------------
+def load_shard_dir(shard_dir: str):
+    """Devuelve (warnings, known_users) guardados en una carpeta de shard."""
+    warnings = WarningsJournal(f"{shard_dir}/warnings.json", f"{shard_dir}/warnings.log").load()
+    known_users = read_json_dict(f"{shard_dir}/known_users.json")
+    return warnings, known_users
+
+
+def write_shard_dir(shard_dir: str, warnings: dict, known_users: dict):
+    """Deja una carpeta de shard con un snapshot limpio (bitácora vacía) y sus known_users."""
+    journal = WarningsJournal(f"{shard_dir}/warnings.json", f"{shard_dir}/warnings.log")
+    journal.compact(warnings)
+    write_json_atomic(f"{shard_dir}/known_users.json", known_users)
+
+
+def reshard_data(workers: int):
+    """
+    Si las carpetas shard-* se escribieron con otro número de shards, junta todo
+    y lo vuelve a repartir con `workers`. Lo nuevo se arma en una carpeta aparte
+    y solo al final se cambia por lo viejo, que queda en /data/resharded-<ts>/.
+    """
+    old_workers = read_json_dict(SHARDS_FILE).get("workers")
+    existing = sorted(glob.glob(f"{DATA_DIR}/shard-*"))
+
+    if existing and old_workers != workers:
+        all_warnings = {}
+        all_known_users = {}
+        for shard_dir in existing:
+            warnings, known_users = load_shard_dir(shard_dir)
+            all_warnings.update(warnings)
+            all_known_users.update(known_users)
+
+        warnings_parts = split_by_shard(all_warnings, workers)
+        known_users_parts = split_by_shard(all_known_users, workers)
+
+        ts = int(time.time())
+        staging_dir = f"{DATA_DIR}/resharding-{ts}"
+        for shard_id in range(workers):
+            write_shard_dir(
+                f"{staging_dir}/shard-{shard_id}",
+                warnings_parts[shard_id],
+                known_users_parts[shard_id],
+            )
+
+        backup_dir = f"{DATA_DIR}/resharded-{ts}"
+        os.makedirs(backup_dir, exist_ok=True)
+        for shard_dir in existing:
+            os.replace(shard_dir, f"{backup_dir}/{os.path.basename(shard_dir)}")
+        for shard_id in range(workers):
+            os.replace(f"{staging_dir}/shard-{shard_id}", shard_data_dir(shard_id))
+        os.rmdir(staging_dir)
+
+        print(
+            f"Repartidos {len(all_warnings)} warnings y {len(all_known_users)} usuarios "
+            f"de {len(existing)} a {workers} shards. Carpetas viejas en {backup_dir}"
+        )
+
+    if old_workers != workers:
+        write_json_atomic(SHARDS_FILE, {"workers": workers})
+
+
+# ------------------ WORKER ------------------
+def run_worker(shard_id: int, queue, processed):
+    """Punto de entrada de cada proceso worker."""
+    # Ctrl+C le llega a todo el grupo de procesos; que solo el frontal decida
+    # cuándo parar, para que el worker alcance a vaciar su cola
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    # Tiene que quedar puesto antes de importar bot: de ahí salen las rutas de /data
+    os.environ["BOT_SHARD"] = str(shard_id)
+    import bot
+
+    print(f"Shard {shard_id} corriendo...")
+    asyncio.run(serve_shard(bot.app, shard_id, queue, processed))
+
+
+async def serve_shard(app, shard_id: int, queue, processed):
+    """
+    Procesa los updates del shard uno por uno, en el orden en que llegaron.
+    Como un chat siempre cae en el mismo shard, el orden dentro del chat se respeta.
+    """
+    loop = asyncio.get_running_loop()
+
+    async with app:
+        # Arranca el JobQueue (borrado de mensajes, compactación de warnings)
+        await app.start()
+        try:
+            while True:
+                data = await loop.run_in_executor(None, queue.get)
+                if data is None:
+                    break
+
+                try:
+                    await app.process_update(Update.de_json(data, app.bot))
+                except Exception as e:
+                    print(f"Shard {shard_id}: error procesando update: {e}", file=sys.stderr)
+
+                with processed.get_lock():
+                    processed[shard_id] += 1
+        finally:
+            await app.stop()
+
+
+# ------------------ FRONTAL ------------------
+def run_sharded(workers: int):
+    # Primero acomodar las carpetas shard-* al número actual; luego sumar lo del modo normal
+    reshard_data(workers)
+    migrate_legacy_data(workers)
+
+    # spawn: cada worker arranca limpio, sin heredar el estado del frontal
+    ctx = multiprocessing.get_context("spawn")
+    queues = [None] * workers
+    procs = [None] * workers
+    processed = ctx.Array("q", workers)
+    routed = [0] * workers
+    dropped = [0] * workers
+    restarts = [0] * workers
+    last_spawn = [0.0] * workers
+    started_at = time.time()
+
+    def spawn_worker(shard_id: int):
+        # Cola nueva siempre: un worker que murió a medio get() puede dejar la vieja trabada
+        old_queue = queues[shard_id]
+        if old_queue is not None:
+            old_queue.cancel_join_thread()
+            old_queue.close()
+
+        queues[shard_id] = ctx.Queue()
+        p = ctx.Process(
+            target=run_worker,
+            args=(shard_id, queues[shard_id], processed),
+            name=f"shard-{shard_id}",
+            daemon=True,
+        )
+        p.start()
+        procs[shard_id] = p
+        last_spawn[shard_id] = time.monotonic()
+
+    def ensure_worker(shard_id: int) -> bool:
+        """Relanza el worker si murió. Devuelve False si sigue caído (esperando para relanzar)."""
+        if procs[shard_id].is_alive():
+            return True
+        if time.monotonic() - last_spawn[shard_id] < RESPAWN_MIN_SECONDS:
+            return False
+
+        # Lo que quedó en la cola del worker muerto se pierde con ella
+        lost = routed[shard_id] - processed[shard_id]
+        dropped[shard_id] += lost
+        routed[shard_id] = processed[shard_id]
+        restarts[shard_id] += 1
+        print(
+            f"Shard {shard_id} murió (exitcode {procs[shard_id].exitcode}); "
+            f"se relanza y se pierden {lost} updates en cola.",
+            file=sys.stderr,
+        )
+        spawn_worker(shard_id)
+        return True
+
+    for shard_id in range(workers):
+        spawn_worker(shard_id)
+
+    def collect_metrics() -> dict:
+        """Junta el estado de todos los workers para /health y /metrics."""
+        shards = []
+        for shard_id, p in enumerate(procs):
+            done = processed[shard_id]
+            shards.append({
+                "shard": shard_id,
+                "alive": p.is_alive(),
+                "routed": routed[shard_id],
+                "processed": done,
+                "pending": routed[shard_id] - done,
+                "dropped": dropped[shard_id],
+                "restarts": restarts[shard_id],
+            })
+
+        return {
+            "ok": all(s["alive"] for s in shards),
+            "workers": workers,
+            "uptime_seconds": int(time.time() - started_at),
+            "routed": sum(routed),
+            "processed": sum(s["processed"] for s in shards),
+            "dropped": sum(dropped),
+            "shards": shards,
+        }
+
+    async def route_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Manda el update al worker de su chat. Sin chat -> shard 0."""
+        chat = update.effective_chat
+        shard_id = shard_for(chat.id, workers) if chat else 0
+
+        # Si el worker está caído y todavía no toca relanzarlo, no acumulamos en su cola
+        if not ensure_worker(shard_id):
+            dropped[shard_id] += 1
+            return
+
+        queues[shard_id].put(update.to_dict())
+        routed[shard_id] += 1
+
+    async def check_workers(context: ContextTypes.DEFAULT_TYPE):
+        """Callback del JobQueue: relanza workers muertos aunque su shard no reciba updates."""
+        for shard_id in range(workers):
+            ensure_worker(shard_id)
+
+    front = ApplicationBuilder().token(BOT_TOKEN).build()
+    front.add_handler(TypeHandler(Update, route_update))
+    if front.job_queue:
+        front.job_queue.run_repeating(
+            check_workers,
+            interval=CHECK_WORKERS_SECONDS,
+            first=CHECK_WORKERS_SECONDS,
+        )
+
+    keep_alive(metrics=collect_metrics)
+
+    print(f"Frontal corriendo con {workers} shards...")
+    try:
+        if WEBHOOK_URL:
+            front.run_webhook(
+                listen="0.0.0.0",
+                port=WEBHOOK_PORT,
+                webhook_url=WEBHOOK_URL,
+            )
+        else:
+            front.run_polling()
+    finally:
+        # Avisar a los workers que terminen lo que tengan en cola y se apaguen
+        for shard_id, p in enumerate(procs):
+            if p.is_alive():
+                queues[shard_id].put(None)
+        for p in procs:
+            p.join(timeout=30)
+
+
+# ---------------- RUN -----------------
+if __name__ == "__main__":
+    run_sharded(BOT_WORKERS)
@@ -0,0 +1,186 @@
+import json
+import os
+import sys
+import time
+
+
+class WarningsJournal:
+    """
+    Persistencia de advertencias como snapshot + bitácora append-only.
+
+    - snapshot_file: JSON completo {"chat_id:user_id": n}, se reescribe solo al compactar
+      (archivo temporal + os.replace, así nunca queda a medias).
+    - journal_file: una línea JSON por evento (warn / unwarn / ban).
+
+    Cada evento guarda el estado final de la llave (el conteo, o su borrado),
+    así que reaplicar la bitácora sobre el snapshot es idempotente: si el bot
+    muere entre escribir el snapshot y recortar la bitácora, al arrancar da lo mismo.
+
+    Compactar va en tres pasos para que lo caro no bloquee al bot:
+    cut() en el event loop, write_snapshot() en un hilo y trim() otra vez en el loop.
+    """
+
+    def __init__(self, snapshot_file: str, journal_file: str):
+        self.snapshot_file = snapshot_file
+        self.journal_file = journal_file
+        self.pending_events = 0
+
+    def load(self) -> dict:
+        """Lee el snapshot y le reaplica la cola de la bitácora. Devuelve el dict de warnings."""
+        warnings = {}
+
+        try:
+            with open(self.snapshot_file, "r") as f:
+                content = f.read().strip()
+                warnings = json.loads(content) if content else {}
+            if not isinstance(warnings, dict):
+                raise ValueError("el snapshot no es un objeto JSON")
+        except FileNotFoundError:
+            pass
+        except ValueError as e:
+            # Apartar el archivo: si no, la primera compactación lo pisa y se pierde para siempre
+            corrupt_file = f"{self.snapshot_file}.corrupt-{int(time.time())}"
+            os.replace(self.snapshot_file, corrupt_file)
+            warnings = {}
+            print(
+                f"Snapshot de warnings corrupto ({self.snapshot_file}): {e}. "
+                f"Se movió a {corrupt_file}; se arranca solo con la bitácora.",
+                file=sys.stderr,
+            )
+
+        try:
+            with open(self.journal_file, "r") as f:
+                for line_number, line in enumerate(f, start=1):
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        event = json.loads(line)
+                    except json.JSONDecodeError:
+                        event = None
+                    if not self._apply(warnings, event):
+                        # Lo normal es que sea la última línea, cortada por un crash a media escritura
+                        print(
+                            f"Línea {line_number} de {self.journal_file} ilegible, se ignora.",
+                            file=sys.stderr,
+                        )
+                        continue
+                    self.pending_events += 1
+        except FileNotFoundError:
+            pass
+
+        return warnings
+
+    @staticmethod
+    def _apply(warnings: dict, event) -> bool:
+        """Aplica un evento. Devuelve False si no tiene la forma esperada."""
+        if not isinstance(event, dict):
+            return False
+
+        key = event.get("key")
+        op = event.get("op")
+        if not isinstance(key, str) or not key:
+            return False
+
+        if op == "warn":
+            count = event.get("count")
+            if not isinstance(count, int) or isinstance(count, bool):
+                return False
+            warnings[key] = count
+        elif op in ("unwarn", "ban"):
+            # unwarn y ban limpian las advertencias de la llave
+            warnings.pop(key, None)
+        else:
+            return False
+
+        return True
+
+    def append(self, op: str, key: str, count: int = None):
+        """Agrega un evento a la bitácora. El costo no depende del tamaño de la tabla."""
+        event = {"op": op, "key": key}
+        if count is not None:
+            event["count"] = count
+        line = json.dumps(event) + "\n"
+
+        try:
+            os.makedirs(os.path.dirname(self.journal_file), exist_ok=True)
+            with open(self.journal_file, "ab+") as f:
+                # Si la última línea quedó a medias (crash, disco lleno), cerrarla antes:
+                # si no, este evento se pega al pedazo y al reaplicar se pierde con él
+                if f.seek(0, os.SEEK_END) > 0:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        line = "\n" + line
+                f.write(line.encode())
+                f.flush()
+                os.fsync(f.fileno())
+            self.pending_events += 1
+        except Exception as e:
+            print(f"Error escribiendo en {self.journal_file}: {e}", file=sys.stderr)
+
+    def cut(self, warnings: dict):
+        """
+        Punto de corte (barato, va en el loop): copia de warnings + hasta qué byte
+        de la bitácora cubre esa copia.
+        """
+        try:
+            offset = os.path.getsize(self.journal_file)
+        except FileNotFoundError:
+            offset = 0
+        return dict(warnings), offset
+
+    def write_snapshot(self, data: dict) -> bool:
+        """Escribe el snapshot de forma atómica. No toca la bitácora, así que puede ir en un hilo."""
+        tmp_file = self.snapshot_file + ".tmp"
+
+        try:
+            os.makedirs(os.path.dirname(self.snapshot_file), exist_ok=True)
+            with open(tmp_file, "w") as f:
+                json.dump(data, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.snapshot_file)
+            self._fsync_dir(self.snapshot_file)
+            return True
+        except Exception as e:
+            print(f"Error escribiendo snapshot de warnings: {e}", file=sys.stderr)
+            return False
+
+    def trim(self, offset: int):
+        """
+        Quita de la bitácora lo que ya quedó en el snapshot (los primeros `offset` bytes).
+        Lo que se escribió después del corte se conserva; suele ser poquito.
+        """
+        try:
+            with open(self.journal_file, "r") as f:
+                f.seek(offset)
+                tail = f.read()
+        except FileNotFoundError:
+            tail = ""
+
+        tmp_file = self.journal_file + ".tmp"
+        try:
+            with open(tmp_file, "w") as f:
+                f.write(tail)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.journal_file)
+            self._fsync_dir(self.journal_file)
+            self.pending_events = sum(1 for line in tail.splitlines() if line.strip())
+        except Exception as e:
+            print(f"Error recortando {self.journal_file}: {e}", file=sys.stderr)
+
+    def compact(self, warnings: dict):
+        """Compactación completa y síncrona (para el arranque, antes de que corra el loop)."""
+        data, offset = self.cut(warnings)
+        if self.write_snapshot(data):
+            self.trim(offset)
+
+    @staticmethod
+    def _fsync_dir(path: str):
+        """fsync de la carpeta del archivo, para que el os.replace también sobreviva a un apagón."""
+        fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)